@@ -1,28 +1,58 @@
+import functools
 import os
 import re
-import sys
-import requests
+
+import anyio
 from mcp.server.fastmcp import FastMCP
-from dotenv import load_dotenv
+
+# 用于错误信息脱敏的 URL 匹配模式，模块加载时编译一次
+_URL_REDACT_RE = re.compile(r"https?://\S+")
 
 current_dir = os.path.dirname(os.path.abspath(__file__))
-project_root = os.path.dirname(os.path.dirname(current_dir))
-env_path = os.path.join(project_root, ".env")
-if os.path.exists(env_path):
-    load_dotenv(env_path)
 
-sys.path.append(current_dir)
 
-try:
-    from search import search
-except ImportError:
-    from .search import search
+def _init_env():
+    """
+    从项目根目录的 .env 文件加载环境变量，仅在作为服务启动时调用。
+
+    设置 GEMINI_SKIP_DOTENV=1 可跳过加载（环境变量已由启动方提供时）。
+    """
+    if os.environ.get("GEMINI_SKIP_DOTENV") == "1":
+        return
+
+    project_root = os.path.dirname(os.path.dirname(current_dir))
+    env_path = os.path.join(project_root, ".env")
+    if os.path.exists(env_path):
+        from dotenv import load_dotenv
+
+        load_dotenv(env_path)
+
+
+# 搜索实现（及其依赖 requests、cachetools 等）延迟到首次调用工具时再导入，
+# 以缩短 MCP 服务的启动时间
+search = None
+
+
+def _load_search():
+    """
+    延迟导入搜索函数，并缓存到模块级变量 search 中。
+    """
+    global search
+    if search is None:
+        if __package__:
+            from .search import search as _search
+        else:
+            # 以脚本方式运行时，脚本所在目录已位于 sys.path[0]
+            from search import search as _search
+        search = _search
+    return search
+
 
 mcp = FastMCP("gemini-grounding")
 
 
 @mcp.tool()
-def google_search(
+async def google_search(
     query: str,
     model: str = "gemini-2.5-flash",
     retry_count: int = 3,
@@ -48,34 +78,48 @@ def google_search(
         search_delay_min: 搜索前最小随机延迟(秒) (默认: 0.0)。
         search_delay_max: 搜索前最大随机延迟(秒) (默认: 0.0)。
     """
+    # 同步工具会被 FastMCP 直接在事件循环上执行，并发请求因此被串行化。
+    # 把阻塞的 search 放到工作线程中运行，同时在途的相同查询才能共享
+    # search 缓存的 single-flight 请求
+    import requests
+
+    search_func = _load_search()
     try:
-        result = search(
-            query,
-            model=model,
-            retry_count=retry_count,
-            retry_delay=retry_delay,
-            search_delay_min=search_delay_min,
-            search_delay_max=search_delay_max,
+        result = await anyio.to_thread.run_sync(
+            functools.partial(
+                search_func,
+                query,
+                model=model,
+                retry_count=retry_count,
+                retry_delay=retry_delay,
+                search_delay_min=search_delay_min,
+                search_delay_max=search_delay_max,
+            )
         )
 
-        output = result["text"]
-        if result["sources"]:
-            output += "\n\n## Sources\n"
-            for src in result["sources"]:
-                output += f"{src['id']}. [{src['title']}]({src['url']})\n"
+        sources = result["sources"]
+        if not sources:
+            return result["text"]
 
-        return output
+        return "".join(
+            [
+                result["text"],
+                "\n\n## Sources\n",
+                *(f"{src['id']}. [{src['title']}]({src['url']})\n" for src in sources),
+            ]
+        )
     except ValueError as e:
         return f"参数错误: {str(e)}"
     except requests.RequestException as e:
         # 脱敏：移除错误信息中的 URL，防止泄露 base_url
-        sanitized = re.sub(r"https?://\S+", "[REDACTED_URL]", str(e))
+        sanitized = _URL_REDACT_RE.sub("[REDACTED_URL]", str(e))
         return f"网络请求失败: {sanitized}"
     except Exception as e:
         # 脱敏：移除错误信息中的 URL，防止泄露 base_url
-        sanitized = re.sub(r"https?://\S+", "[REDACTED_URL]", str(e))
+        sanitized = _URL_REDACT_RE.sub("[REDACTED_URL]", str(e))
         return f"搜索失败: {sanitized}"
 
 
 if __name__ == "__main__":
+    _init_env()
     mcp.run()
@@ -1,18 +1,19 @@
 import argparse
+import atexit
 import os
+import re
 import sys
-import json
 import time
 import random
 import logging
+import orjson
 import requests
 import concurrent.futures
-from functools import lru_cache
-from urllib.parse import urlparse
-from fake_useragent import UserAgent
+import itertools
+from urllib.parse import urljoin, urlparse
 from cachetools import cached, TTLCache
 from cachetools.keys import hashkey
-from threading import RLock
+from threading import Condition, Lock, RLock
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 
@@ -23,32 +24,183 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Grounding citations point at this redirect service; only these URLs need resolving.
+_GROUNDING_PREFIX = "https://vertexaisearch.cloud.google.com/grounding-api-redirect/"
+
+# Matches the canonical URL in a `Link` response header.
+_CANONICAL_LINK_RE = re.compile(r'<([^>]+)>;\s*rel="canonical"')
+
+
+# A small pool of current desktop browser User-Agent strings. Each process only
+# needs one, so a static tuple avoids loading a full user-agent database.
+_UA_POOL = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/130.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36 Edg/131.0.0.0",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/130.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:133.0) Gecko/20100101 Firefox/133.0",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:132.0) Gecko/20100101 Firefox/132.0",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10.15; rv:133.0) Gecko/20100101 Firefox/133.0",
+    "Mozilla/5.0 (X11; Linux x86_64; rv:133.0) Gecko/20100101 Firefox/133.0",
+    "Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:132.0) Gecko/20100101 Firefox/132.0",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/18.1 Safari/605.1.15",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.6 Safari/605.1.15",
+)
+
+DEFAULT_BASE_URL = "https://generativelanguage.googleapis.com"
+
+# Keep the HTTP connection pool and the URL resolver sized together so that a
+# full batch of concurrent HEAD requests can reuse pooled connections.
+try:
+    RESOLVE_MAX_WORKERS = int(os.environ.get("GEMINI_RESOLVE_WORKERS", "20"))
+    if RESOLVE_MAX_WORKERS < 1:
+        raise ValueError(RESOLVE_MAX_WORKERS)
+except ValueError:
+    print(
+        "Warning: Invalid GEMINI_RESOLVE_WORKERS value, defaulting to 20.",
+        file=sys.stderr,
+    )
+    RESOLVE_MAX_WORKERS = 20
+HTTP_POOL_MAXSIZE = RESOLVE_MAX_WORKERS
+# Upper bound (seconds) on how long a search waits for its whole batch of
+# redirects; anything still pending falls back to the original URI.
+RESOLVE_BATCH_TIMEOUT = 15
+
+
+_RETRY = Retry(
+    total=3,
+    backoff_factor=0.5,
+    status_forcelist=(429, 500, 502, 503, 504),
+    allowed_methods=frozenset(
+        {"HEAD", "GET", "POST", "PUT", "DELETE", "OPTIONS", "TRACE"}
+    ),
+)
+# Adapters are built once and may be shared by sessions: the underlying urllib3
+# PoolManager is thread-safe.
+_ADAPTER = HTTPAdapter(
+    pool_connections=20, pool_maxsize=HTTP_POOL_MAXSIZE, max_retries=_RETRY
+)
+# Gemini requests are retried by _perform_search, which honours the caller's
+# retry_count/retry_delay and backs off on 429. At the transport level only
+# failed connection attempts are retried; retrying statuses here as well would
+# multiply every application-level attempt by up to four upstream requests.
+_API_RETRY = Retry(total=3, connect=3, read=0, status=0, other=0, backoff_factor=0.5)
+# The Gemini API gets a dedicated adapter (and therefore its own pool manager),
+# so HEAD requests to many redirect targets cannot evict the keep-alive
+# connection to the API host and force a new TLS handshake.
+_API_ADAPTER = HTTPAdapter(
+    pool_connections=1, pool_maxsize=HTTP_POOL_MAXSIZE, max_retries=_API_RETRY
+)
+
+
+def _pick_user_agent():
+    """
+    Pick the session User-Agent from the built-in pool.
+    With GEMINI_FAKE_USERAGENT=1 it is drawn from the fake-useragent database
+    instead (requires the optional `fake-useragent` extra).
+    """
+    if os.environ.get("GEMINI_FAKE_USERAGENT") == "1":
+        try:
+            from fake_useragent import UserAgent
+
+            return UserAgent().random
+        except Exception as e:
+            logger.warning(f"fake-useragent unavailable, using built-in pool: {e}")
+    return random.choice(_UA_POOL)
+
 
 def create_session():
     session = requests.Session()
-    try:
-        ua = UserAgent()
-        user_agent = ua.random
-    except Exception:
-        user_agent = "GeminiGrounding/1.0"
-
-    session.headers.update({"User-Agent": user_agent})
-
-    retry_strategy = Retry(
-        total=3,
-        backoff_factor=0.5,
-        status_forcelist=[429, 500, 502, 503, 504],
-        allowed_methods=["HEAD", "GET", "POST", "PUT", "DELETE", "OPTIONS", "TRACE"],
-    )
-    adapter = HTTPAdapter(
-        pool_connections=20, pool_maxsize=20, max_retries=retry_strategy
-    )
-    session.mount("http://", adapter)
-    session.mount("https://", adapter)
+    session.headers.update({"User-Agent": _pick_user_agent()})
+    session.mount("http://", _ADAPTER)
+    session.mount("https://", _ADAPTER)
+    session.mount(DEFAULT_BASE_URL, _API_ADAPTER)
+    base_url = os.environ.get("GEMINI_BASE_URL")
+    if base_url:
+        session.mount(base_url, _API_ADAPTER)
     return session
 
 
-session = create_session()
+# Built on first use by _get_session(), so --help and --dry-run never set up
+# the HTTP stack. Tests patch this attribute directly.
+session = None
+_session_lock = Lock()
+
+
+def _get_session():
+    """Return the shared session, creating it on first use."""
+    global session
+    if session is None:
+        with _session_lock:
+            if session is None:
+                session = create_session()
+    return session
+
+
+# Shared resolver pool: worker threads are started on demand and reused across
+# searches instead of being created and torn down for every response.
+_RESOLVE_POOL = concurrent.futures.ThreadPoolExecutor(
+    max_workers=RESOLVE_MAX_WORKERS, thread_name_prefix="url-resolve"
+)
+atexit.register(_RESOLVE_POOL.shutdown, wait=False)
+
+# Optional HTTP/2 client for redirect HEADs (GEMINI_HTTP2=1, `http2` extra).
+# Every lookup goes to the same host (the grounding service or the proxy), so
+# concurrent HEADs are multiplexed over one connection and one TLS handshake
+# instead of one pooled socket each.
+_http2_client = None
+_http2_client_lock = Lock()
+_http2_unavailable = False
+
+
+def _get_http2_client():
+    """
+    Return the shared HTTP/2 client, or None if GEMINI_HTTP2 is not enabled
+    or httpx[http2] is not installed.
+    """
+    global _http2_client, _http2_unavailable
+    if _http2_unavailable or os.environ.get("GEMINI_HTTP2") != "1":
+        return None
+    if _http2_client is not None:
+        return _http2_client
+    with _http2_client_lock:
+        if _http2_client is None and not _http2_unavailable:
+            try:
+                import httpx
+
+                _http2_client = httpx.Client(
+                    http2=True,
+                    headers={"User-Agent": _get_session().headers["User-Agent"]},
+                    limits=httpx.Limits(
+                        max_connections=RESOLVE_MAX_WORKERS,
+                        max_keepalive_connections=RESOLVE_MAX_WORKERS,
+                    ),
+                )
+                atexit.register(_http2_client.close)
+            except ImportError as e:
+                logger.warning(f"HTTP/2 unavailable, using requests session: {e}")
+                _http2_unavailable = True
+    return _http2_client
+
+
+def _head(url, **kwargs):
+    """
+    Send a HEAD request without following redirects, over HTTP/2 when enabled.
+    Transport errors are raised as requests.RequestException either way.
+    """
+    client = _get_http2_client()
+    if client is None:
+        return _get_session().head(url, allow_redirects=False, timeout=5, **kwargs)
+
+    import httpx
+
+    try:
+        return client.head(url, timeout=5, **kwargs)
+    except httpx.HTTPError as e:
+        raise requests.ConnectionError(str(e)) from e
+
 
 # Cache configuration
 # Default TTL: 1 hour (3600 seconds)
@@ -71,40 +223,96 @@ except ValueError:
     SEARCH_CACHE_MAXSIZE = 100
 
 search_cache = TTLCache(maxsize=SEARCH_CACHE_MAXSIZE, ttl=SEARCH_CACHE_TTL)
-search_cache_lock = RLock()
+# Only the cached() wrapper takes this lock and it never re-enters it, so a
+# plain Lock is enough.
+search_cache_lock = Lock()
+# Single-flight: concurrent cache misses for the same key wait on this
+# condition for the first caller's result instead of each querying the API.
+search_cache_condition = Condition(search_cache_lock)
+
+# Resolved grounding redirects expire (default: 1 day), so a redirect whose
+# destination changes is eventually re-resolved.
+try:
+    URL_CACHE_TTL = int(os.environ.get("GEMINI_URL_CACHE_TTL", "86400"))
+except ValueError:
+    print(
+        "Warning: Invalid GEMINI_URL_CACHE_TTL value, defaulting to 86400 seconds.",
+        file=sys.stderr,
+    )
+    URL_CACHE_TTL = 86400
+
+url_cache = TTLCache(maxsize=10000, ttl=URL_CACHE_TTL)
+# URLs that could not be resolved are remembered briefly, so repeated lookups
+# (e.g. with a misconfigured proxy) do not pay a HEAD round trip every time.
+url_negative_cache = TTLCache(maxsize=10000, ttl=60)
+url_cache_lock = RLock()
 
 
-@lru_cache(maxsize=1000)
-def resolve_url(url):
+def _get_proxy_base():
+    """
+    Read the optional resolver proxy from GEMINI_PROXY_URL, without trailing slash.
+    """
+    return os.environ.get("GEMINI_PROXY_URL", "").rstrip("/")
+
+
+def _cached_resolution(url):
+    """
+    Look up url in the resolution caches; caller must hold url_cache_lock.
+    Returns the cached destination, url itself if it recently failed to
+    resolve, or None on a cache miss.
+    """
+    cached_url = url_cache.get(url)
+    if cached_url is None and url in url_negative_cache:
+        cached_url = url
+    return cached_url
+
+
+def resolve_url(url, proxy_base=None):
     """
     Resolve Google's grounding redirect URLs to their original destination.
-    Uses HEAD request to minimize bandwidth. Caches results to avoid redundant requests.
-    Returns the original URL if resolution succeeds, otherwise returns the input URL.
+    Results are cached in url_cache; non-grounding URLs are returned as-is
+    without touching the cache or the environment.
+    proxy_base defaults to GEMINI_PROXY_URL; batch callers pass it in so the
+    environment is read once per batch.
     """
-    if not url.startswith(
-        "https://vertexaisearch.cloud.google.com/grounding-api-redirect/"
-    ):
+    if not url.startswith(_GROUNDING_PREFIX):
         return url
 
-    proxy_base = os.environ.get("GEMINI_PROXY_URL")
+    with url_cache_lock:
+        cached_url = _cached_resolution(url)
+    if cached_url is not None:
+        return cached_url
 
-    if proxy_base:
-        if proxy_base.endswith("/"):
-            proxy_base = proxy_base[:-1]
+    if proxy_base is None:
+        proxy_base = _get_proxy_base()
 
+    resolved = _resolve_redirect(url, proxy_base)
+    with url_cache_lock:
+        if resolved is None:
+            url_negative_cache[url] = True
+            return url
+        url_cache[url] = resolved
+    return resolved
+
+
+def _resolve_redirect(url, proxy_base):
+    """
+    Resolve a single grounding redirect URL over the network.
+    Uses HEAD request to minimize bandwidth.
+    Returns the destination URL, or None if it could not be determined.
+    """
+    if proxy_base:
         proxy_url = f"{proxy_base}/{url}"
 
         try:
-            response = session.head(
-                proxy_url,
-                allow_redirects=False,
-                timeout=5,
-                headers={"X-Proxy-Manual-Redirect": "true"},
+            response = _head(
+                proxy_url, headers={"X-Proxy-Manual-Redirect": "true"}
             )
 
             final_url = response.headers.get("X-Final-Url")
             if final_url:
-                return final_url
+                # worker.js echoes the requested URL when it found no destination
+                return final_url if final_url != url else None
 
             if 300 <= response.status_code < 400:
                 location = response.headers.get("Location")
@@ -114,9 +322,7 @@ def resolve_url(url):
             if response.status_code == 200:
                 link_header = response.headers.get("Link")
                 if link_header:
-                    import re
-
-                    match = re.search(r'<([^>]+)>;\s*rel="canonical"', link_header)
+                    match = _CANONICAL_LINK_RE.search(link_header)
                     if match:
                         return match.group(1)
 
@@ -127,37 +333,163 @@ def resolve_url(url):
             pass
     else:
         try:
-            response = session.head(
-                url,
-                allow_redirects=True,
-                timeout=5,
-            )
-            if response.status_code == 200:
-                return response.url
+            # The grounding service answers with a redirect to the cited page, so
+            # the first hop's Location is all we need. Following the chain would
+            # open a connection to every destination host just to HEAD it.
+            response = _head(url)
+            if 300 <= response.status_code < 400:
+                location = response.headers.get("Location")
+                if location:
+                    return urljoin(url, location)
+            elif response.status_code == 200:
+                # Redirects are not followed, so response.url is still the
+                # grounding URL; only a canonical link names the destination
+                link_header = response.headers.get("Link")
+                if link_header:
+                    match = _CANONICAL_LINK_RE.search(link_header)
+                    if match:
+                        return match.group(1)
         except requests.RequestException:
             pass
         except Exception as e:
             logger.warning(f"Unexpected error resolving URL {url}: {e}")
             pass
 
-    return url
+    return None
+
+
+def _resolve_url_safe(url, proxy_base):
+    """
+    resolve_url for the resolver pool: an unexpected error for one URI falls
+    back to the original URI instead of aborting the rest of the batch.
+    """
+    try:
+        return resolve_url(url, proxy_base)
+    except Exception as e:
+        logger.error(f"Error resolving {url}: {e}")
+        return url
+
+
+# Proxies that answered /batch with 400/404/405 (older worker deployments);
+# they are resolved URL by URL without retrying the batch endpoint.
+_batch_unsupported_proxies = set()
+# Must not exceed MAX_BATCH_URLS in worker/worker.js, which rejects larger
+# batches with 413.
+PROXY_BATCH_SIZE = 50
+
+
+def resolve_urls_batch(uris, proxy_base):
+    """
+    Resolve grounding redirects through the proxy's /batch endpoint.
+    The proxy takes {"urls": [...]} and answers with a {url: final_url} map;
+    misses are sent in chunks of PROXY_BATCH_SIZE.
+    Cached URIs are answered locally. URIs in a successful response are stored
+    in url_cache, or in url_negative_cache when the proxy has no answer for
+    them: either missing from the map or mapped to themselves, which is what
+    worker.js sends for a page without a redirect or canonical link. URIs
+    whose chunk failed in transit are left out of the result so the caller
+    can resolve them URL by URL.
+    Returns a dictionary mapping original URI to resolved URI, or None if the
+    proxy does not support batching.
+    """
+    results = {}
+    misses = []
+    with url_cache_lock:
+        for uri in dict.fromkeys(uris):
+            cached_url = _cached_resolution(uri)
+            if cached_url is not None:
+                results[uri] = cached_url
+            else:
+                misses.append(uri)
+
+    for start in range(0, len(misses), PROXY_BATCH_SIZE):
+        chunk = misses[start : start + PROXY_BATCH_SIZE]
+        try:
+            response = _get_session().post(
+                f"{proxy_base}/batch",
+                data=orjson.dumps({"urls": chunk}),
+                headers={"Content-Type": "application/json"},
+                timeout=10,
+            )
+            if response.status_code in (400, 404, 405):
+                _batch_unsupported_proxies.add(proxy_base)
+                return None
+            response.raise_for_status()
+            resolved_map = orjson.loads(response.content)
+            if not isinstance(resolved_map, dict):
+                raise ValueError("batch response is not a JSON object")
+        except (requests.RequestException, ValueError) as e:
+            logger.warning(
+                f"Batch resolution via proxy failed, resolving {len(chunk)} URIs individually: {e}"
+            )
+            continue
+
+        with url_cache_lock:
+            for uri in chunk:
+                resolved = resolved_map.get(uri)
+                if resolved and resolved != uri:
+                    url_cache[uri] = resolved
+                    results[uri] = resolved
+                else:
+                    url_negative_cache[uri] = True
+                    results[uri] = uri
+    return results
 
 
 def resolve_urls_concurrently(uris):
     """
-    Resolves a list of URLs concurrently using a thread pool.
+    Resolves a collection of URLs concurrently using the shared resolver pool.
+    With a proxy that supports it, the batch goes through its /batch endpoint
+    first, and only URIs it could not deliver fall back to the pool.
+    The pool allows up to RESOLVE_MAX_WORKERS threads, so a typical response is
+    resolved in a single wave instead of several blocking rounds.
+    Accepts any iterable of URIs; duplicates are resolved once.
     Returns a dictionary mapping original URI to resolved URI.
     """
+    # Only grounding redirects need a lookup; everything else maps to itself
+    # without a trip through the pool or the cache.
     results = {}
-    with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
-        future_to_uri = {executor.submit(resolve_url, uri): uri for uri in uris}
-        for future in concurrent.futures.as_completed(future_to_uri):
-            uri = future_to_uri[future]
-            try:
-                results[uri] = future.result()
-            except Exception as e:
-                logger.error(f"Error resolving URI {uri}: {e}")
-                results[uri] = uri
+    pending = []
+    for uri in dict.fromkeys(uris):
+        if uri.startswith(_GROUNDING_PREFIX):
+            pending.append(uri)
+        else:
+            results[uri] = uri
+    if not pending:
+        return results
+
+    proxy_base = _get_proxy_base()
+    if proxy_base and proxy_base not in _batch_unsupported_proxies:
+        batch_results = resolve_urls_batch(pending, proxy_base)
+        if batch_results is not None:
+            results.update(batch_results)
+            # Whatever the batch could not deliver goes through the pool below
+            pending = [uri for uri in pending if uri not in batch_results]
+            if not pending:
+                return results
+
+    resolved_count = 0
+    try:
+        resolved_iter = _RESOLVE_POOL.map(
+            _resolve_url_safe,
+            pending,
+            itertools.repeat(proxy_base),
+            timeout=RESOLVE_BATCH_TIMEOUT,
+        )
+        for uri, resolved in zip(pending, resolved_iter):
+            results[uri] = resolved
+            resolved_count += 1
+    except concurrent.futures.TimeoutError:
+        logger.warning(
+            f"Timed out resolving {len(pending) - resolved_count} of {len(pending)} URIs"
+        )
+
+    # map() yields in submission order, so one slow lookup can hide results that
+    # already finished; those are still recoverable from url_cache.
+    if resolved_count < len(pending):
+        with url_cache_lock:
+            for uri in pending[resolved_count:]:
+                results[uri] = url_cache.get(uri, uri)
     return results
 
 
@@ -165,11 +497,18 @@ def _search_cache_key(query, model, api_key, base_url, *args, **kwargs):
     """
     Generate a cache key for the search function.
     We exclude retry configurations and debug flags from the cache key.
+    The query is whitespace-collapsed and lower-cased, so queries differing
+    only in spacing or letter case share one cache entry.
     """
-    return hashkey(query, model, base_url)
+    return hashkey(" ".join(query.split()).lower(), model, base_url)
 
 
-@cached(cache=search_cache, key=_search_cache_key, lock=search_cache_lock)
+@cached(
+    cache=search_cache,
+    key=_search_cache_key,
+    lock=search_cache_lock,
+    condition=search_cache_condition,
+)
 def _perform_search(
     query,
     model,
@@ -197,6 +536,13 @@ def _perform_search(
     MAX_RETRY_DELAY = 60
     retry_delay = min(max(0, retry_delay), MAX_RETRY_DELAY)
 
+    # Exponential backoff schedule, computed once. Delays reach the cap well
+    # before 16 doublings, so later attempts simply reuse the last entry.
+    backoff = tuple(
+        min(retry_delay * (2**i), MAX_RETRY_DELAY)
+        for i in range(min(retry_count + 1, 16))
+    )
+
     url = f"{base_url}/v1beta/models/{model}:generateContent"
     headers = {
         "Content-Type": "application/json",
@@ -210,7 +556,10 @@ def _perform_search(
     }
 
     if debug:
-        print(json.dumps(payload, indent=2))
+        print(orjson.dumps(payload, option=orjson.OPT_INDENT_2).decode())
+
+    # Serialize once up front; the same body is reused across retries.
+    body = orjson.dumps(payload)
 
     if search_delay_max > search_delay_min and search_delay_max > 0:
         sleep_time = random.uniform(search_delay_min, search_delay_max)
@@ -221,13 +570,17 @@ def _perform_search(
 
     for attempt in range(retry_count + 1):
         try:
-            response = session.post(
-                url, json=payload, headers=headers, timeout=(10, 60)
+            response = _get_session().post(
+                url, data=body, headers=headers, timeout=(10, 60)
             )
 
-            if response.status_code == 429:
+            # 最后一次仍被限流时交给 raise_for_status 抛出 HTTPError，而不是返回 None
+            if response.status_code == 429 and attempt < retry_count:
                 # 忽略 Retry-After，使用指数退避策略重试
-                wait_time = min(retry_delay * (2**attempt) + random.uniform(0, 1), 60)
+                wait_time = min(
+                    backoff[min(attempt, len(backoff) - 1)] + random.random(),
+                    MAX_RETRY_DELAY,
+                )
 
                 logger.warning(f"Rate limited (429). Retrying in {wait_time}s...")
                 time.sleep(wait_time)
@@ -236,33 +589,39 @@ def _perform_search(
             response.raise_for_status()
 
             # Process response
-            full_text = ""
-            all_grounding_chunks = []
+            text_parts = []
+            # URI of each grounding chunk by index (None if absent), used to map supports
+            chunk_uris = []
+            # (uri, title) of every chunk that has a URI, in response order
+            chunk_meta = []
             all_supports = []
 
             try:
-                data = response.json()
+                data = orjson.loads(response.content)
                 if debug:
-                    print(json.dumps(data, indent=2))
+                    print(orjson.dumps(data, option=orjson.OPT_INDENT_2).decode())
 
-                if isinstance(data, dict):
-                    candidates = data.get("candidates", [])
-                elif isinstance(data, list) and len(data) > 0:
-                    candidates = data[0].get("candidates", [])
-                else:
-                    candidates = []
+                # Some proxies wrap the response object in a one-element list
+                root = data[0] if isinstance(data, list) and data else data
+                candidates = (
+                    root.get("candidates", []) if isinstance(root, dict) else []
+                )
 
                 if candidates:
                     candidate = candidates[0]
                     content_parts = candidate.get("content", {}).get("parts", [])
                     for part in content_parts:
                         if "text" in part:
-                            full_text += part["text"]
+                            text_parts.append(part["text"])
 
                     grounding_metadata = candidate.get("groundingMetadata", {})
                     g_chunks = grounding_metadata.get("groundingChunks", [])
-                    if g_chunks:
-                        all_grounding_chunks.extend(g_chunks)
+                    for chunk in g_chunks:
+                        web = chunk.get("web", {})
+                        uri = web.get("uri")
+                        chunk_uris.append(uri)
+                        if uri:
+                            chunk_meta.append((uri, web.get("title")))
 
                     g_supports = grounding_metadata.get("groundingSupports", [])
                     for support in g_supports:
@@ -270,77 +629,86 @@ def _perform_search(
                         segment = support.get("segment", {})
                         uris = []
                         for idx in indices:
-                            if idx < len(all_grounding_chunks):
-                                u = all_grounding_chunks[idx].get("web", {}).get("uri")
+                            if idx < len(chunk_uris):
+                                u = chunk_uris[idx]
                                 if u:
                                     uris.append(u)
                         all_supports.append({"segment": segment, "uris": uris})
 
-            except json.JSONDecodeError:
+            except orjson.JSONDecodeError:
                 logger.warning("Failed to decode JSON response")
                 continue
 
-            uris_to_resolve = set()
-            for chunk in all_grounding_chunks:
-                web = chunk.get("web", {})
-                uri = web.get("uri")
-                if uri:
-                    uris_to_resolve.add(uri)
+            full_text = "".join(text_parts)
 
-            resolved_map = resolve_urls_concurrently(list(uris_to_resolve))
-
-            final_sources = []
-            url_to_id = {}
-            original_url_to_id = {}
-            next_id = 1
-
-            for chunk in all_grounding_chunks:
-                web = chunk.get("web", {})
-                uri = web.get("uri")
-                title = web.get("title")
-
-                if uri:
-                    resolved = resolved_map.get(uri, uri)
-                    if resolved not in url_to_id:
-                        url_to_id[resolved] = next_id
-                        final_sources.append(
-                            {"id": next_id, "title": title, "url": resolved}
-                        )
-                        next_id += 1
-                    original_url_to_id[uri] = url_to_id[resolved]
-
-            # Sort supports by endIndex in descending order to insert citations from end to start
-            # This prevents index shifting issues
-            all_supports.sort(
-                key=lambda x: x["segment"].get("endIndex", 0), reverse=True
+            resolved_map = (
+                resolve_urls_concurrently(uri for uri, _ in chunk_meta)
+                if chunk_meta
+                else {}
             )
 
+            # Source records keyed by resolved URL; insertion order is id order
+            sources_by_url = {}
+            original_url_to_id = {}
+            # Bound once: these run for every chunk of the response
+            get_source = sources_by_url.get
+            get_resolved = resolved_map.get
+
+            for uri, title in chunk_meta:
+                # Chunks often repeat a URI; its id is already known
+                if uri in original_url_to_id:
+                    continue
+                resolved = get_resolved(uri, uri)
+                # A record is only built for a URL that has not been seen yet
+                source = get_source(resolved)
+                if source is None:
+                    source = sources_by_url[resolved] = {
+                        "id": len(sources_by_url) + 1,
+                        "title": title,
+                        "url": resolved,
+                    }
+                original_url_to_id[uri] = source["id"]
+
+            final_sources = list(sources_by_url.values())
+
+            # Gemini reports segment endIndex as a UTF-8 byte offset, so citations
+            # are inserted into the encoded text. Collect (endIndex, citation)
+            # pairs first, then rebuild the text in a single ascending pass
+            # instead of re-slicing it once per citation.
+            text_bytes = full_text.encode("utf-8")
+            insertions = []
             for support in all_supports:
                 end_idx = support["segment"].get("endIndex")
                 uris = support["uris"]
 
                 # Verify end_idx is valid
-                if end_idx is not None:
-                    ids = []
-                    for u in uris:
-                        if u in original_url_to_id:
-                            ids.append(original_url_to_id[u])
-                    ids = sorted(list(set(ids)))
-
+                if end_idx is not None and end_idx <= len(text_bytes):
+                    ids = sorted(
+                        {original_url_to_id[u] for u in uris if u in original_url_to_id}
+                    )
                     if ids:
                         citation = f" [{', '.join(map(str, ids))}]"
-                        # Insert citation into the string at the character index
-                        # Since we iterate in reverse order, previous insertions don't affect current index
-                        if end_idx <= len(full_text):
-                            full_text = (
-                                full_text[:end_idx] + citation + full_text[end_idx:]
-                            )
+                        insertions.append((end_idx, citation.encode("utf-8")))
+
+            if insertions:
+                insertions.sort(key=lambda x: x[0])
+                out = bytearray()
+                prev = 0
+                for end_idx, citation in insertions:
+                    out += text_bytes[prev:end_idx]
+                    out += citation
+                    prev = end_idx
+                out += text_bytes[prev:]
+                full_text = out.decode("utf-8", errors="replace")
 
             return {"text": full_text, "sources": final_sources}
 
         except requests.RequestException as e:
             if attempt < retry_count:
-                wait_time = min(retry_delay * (2**attempt) + random.uniform(0, 1), 60)
+                wait_time = min(
+                    backoff[min(attempt, len(backoff) - 1)] + random.random(),
+                    MAX_RETRY_DELAY,
+                )
                 if debug:
                     logger.warning(
                         f"Request failed (attempt {attempt + 1}/{retry_count + 1}): {e}. Retrying in {wait_time:.2f}s..."
@@ -366,9 +734,7 @@ def search(
     if api_key is None:
         api_key = os.environ.get("GEMINI_API_KEY")
     if base_url is None:
-        base_url = os.environ.get(
-            "GEMINI_BASE_URL", "https://generativelanguage.googleapis.com"
-        )
+        base_url = os.environ.get("GEMINI_BASE_URL", DEFAULT_BASE_URL)
     if retry_count is None:
         retry_count = int(os.environ.get("GEMINI_RETRY_COUNT", "3"))
     if retry_delay is None:
@@ -378,7 +744,12 @@ def search(
     if search_delay_max is None:
         search_delay_max = float(os.environ.get("GEMINI_SEARCH_DELAY_MAX", "0.0"))
 
-    return _perform_search(
+    # GEMINI_CACHE_ENABLED=0 bypasses search_cache and always queries the API.
+    perform = _perform_search
+    if os.environ.get("GEMINI_CACHE_ENABLED", "1").lower() in ("0", "false", "no"):
+        perform = _perform_search.__wrapped__
+
+    return perform(
         query=query,
         model=model,
         api_key=api_key,
@@ -408,9 +779,7 @@ def main():
         if args.dry_run:
             # Just print the payload structure (simplified for dry run)
             api_key = os.environ.get("GEMINI_API_KEY", "dummy")
-            base_url = os.environ.get(
-                "GEMINI_BASE_URL", "https://generativelanguage.googleapis.com"
-            )
+            base_url = os.environ.get("GEMINI_BASE_URL", DEFAULT_BASE_URL)
             url = f"{base_url}/v1beta/models/{args.model}:generateContent"
             tools = [{"googleSearch": {}}]
             payload = {
@@ -418,15 +787,19 @@ def main():
                 "tools": tools,
                 "generationConfig": {"temperature": 0.0},
             }
-            print(json.dumps(payload, indent=2))
+            print(orjson.dumps(payload, option=orjson.OPT_INDENT_2).decode())
             return
 
         result = search(args.query, model=args.model, debug=args.debug)
         print(result["text"])
         if result["sources"]:
             print("\n\n## Sources\n")
-            for src in result["sources"]:
-                print(f"{src['id']}. [{src['title']}]({src['url']})")
+            print(
+                "\n".join(
+                    f"{src['id']}. [{src['title']}]({src['url']})"
+                    for src in result["sources"]
+                )
+            )
     except Exception as e:
         print(f"Error: {e}", file=sys.stderr)
         sys.exit(1)
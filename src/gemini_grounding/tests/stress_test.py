@@ -6,9 +6,13 @@ MCP 服务压测脚本
 """
 
 import asyncio
+import contextlib
+import functools
 import os
+import re
 import sys
 import time
+import math
 import statistics
 import traceback
 from dataclasses import dataclass, field
@@ -27,7 +31,7 @@ class CallResult:
 
     query: str
     success: bool
-    duration: float
+    duration: int  # 纳秒
     error: str = ""
     response_len: int = 0
     has_sources: bool = False
@@ -38,8 +42,8 @@ class StressReport:
     """压测报告"""
 
     results: list = field(default_factory=list)
-    start_time: float = 0.0
-    end_time: float = 0.0
+    start_time: int = 0  # perf_counter_ns
+    end_time: int = 0
 
     @property
     def total(self):
@@ -53,28 +57,24 @@ class StressReport:
     def failures(self):
         return [r for r in self.results if not r.success]
 
-    @property
-    def durations(self):
-        return [r.duration for r in self.successes]
-
 
 # ============================================================
 # 工具函数
 # ============================================================
 
 
-def format_duration(seconds):
+def format_duration(ns):
     """
     格式化耗时为可读字符串
 
     参数:
-        seconds: 秒数
+        ns: 纳秒数，只在输出时换算为秒/毫秒
     返回值:
         格式化后的字符串，如 "1.23s"
     """
-    if seconds < 1:
-        return f"{seconds * 1000:.0f}ms"
-    return f"{seconds:.2f}s"
+    if ns < 1_000_000_000:
+        return f"{ns / 1e6:.0f}ms"
+    return f"{ns / 1e9:.2f}s"
 
 
 def print_separator(title=""):
@@ -97,27 +97,33 @@ def compute_stats(durations):
     计算耗时统计数据
 
     参数:
-        durations: 耗时列表（秒）
+        durations: 耗时列表（纳秒）
     返回值:
         dict: 包含 min/max/avg/median/p95/p99/stdev 的字典
     """
     if not durations:
         return {}
 
+    # 只排序一次，中位数和分位数直接从有序列表取；
+    # 均值/标准差用 math.fsum 计算，避免 statistics 模块的分数精确运算和重复排序
     sorted_d = sorted(durations)
     n = len(sorted_d)
+    mid = n // 2
+    avg = math.fsum(sorted_d) / n
 
     result = {
         "min": sorted_d[0],
         "max": sorted_d[-1],
-        "avg": statistics.mean(sorted_d),
-        "median": statistics.median(sorted_d),
+        "avg": avg,
+        "median": sorted_d[mid] if n % 2 else (sorted_d[mid - 1] + sorted_d[mid]) / 2,
         "p95": sorted_d[int(n * 0.95)] if n >= 2 else sorted_d[-1],
         "p99": sorted_d[int(n * 0.99)] if n >= 2 else sorted_d[-1],
     }
 
     if n >= 2:
-        result["stdev"] = statistics.stdev(sorted_d)
+        result["stdev"] = math.sqrt(
+            math.fsum((d - avg) ** 2 for d in sorted_d) / (n - 1)
+        )
 
     return result
 
@@ -148,13 +154,65 @@ QUERIES_EDGE = [
     "' OR 1=1 --",  # SQL 注入
 ]
 
+# 突发流量查询
+QUERIES_BURST = tuple(f"技术问题 {i}" for i in range(10))
+
+# 无效参数组合: (标签, 额外参数)
+INVALID_CASES = (
+    (
+        "不存在的模型",
+        {"model": "nonexistent-model-xyz"},
+    ),
+    (
+        "负数重试",
+        {"retry_count": -1},
+    ),
+    (
+        "超大重试延迟",
+        {"retry_delay": 99999},
+    ),
+)
+
+
+# 状态符号，按 CallResult.success 索引 (False -> ✗, True -> ✓)
+_STATUS = ("✗", "✓")
+
+# 同时在途的请求上限，防止突发测试一次性压垮 MCP 服务
+try:
+    STRESS_CONCURRENCY = int(os.environ.get("STRESS_CONCURRENCY", "8"))
+    # 0 会让所有 call_tool 永远等待信号量，负数会让 Semaphore 构造失败
+    if STRESS_CONCURRENCY < 1:
+        raise ValueError(STRESS_CONCURRENCY)
+except ValueError:
+    print(
+        "Warning: Invalid STRESS_CONCURRENCY value, defaulting to 8.",
+        file=sys.stderr,
+    )
+    STRESS_CONCURRENCY = 8
+_SEM = asyncio.Semaphore(STRESS_CONCURRENCY)
+
+# 突发测试使用的 MCP 服务进程 (会话) 数量。google_search 在工作线程中执行，
+# 单个会话即可并发处理请求，默认只启动一个服务进程；
+# 设为大于 1 时突发请求会分散到多个进程 (各自独立的缓存和连接池)
+try:
+    STRESS_SESSIONS = max(1, int(os.environ.get("STRESS_SESSIONS", "1")))
+except ValueError:
+    print(
+        "Warning: Invalid STRESS_SESSIONS value, defaulting to 1.",
+        file=sys.stderr,
+    )
+    STRESS_SESSIONS = 1
+
+# 服务端错误响应的前缀
+_ERROR_RE = re.compile(r"(?:Error performing search:|搜索失败:|参数错误:)")
+
 
 # ============================================================
 # 核心测试逻辑
 # ============================================================
 
 
-async def call_tool(session, query, tool_args=None):
+async def call_tool(session, query, tool_args=None, call=None):
     """
     调用 MCP 工具并记录结果
 
@@ -162,58 +220,50 @@ async def call_tool(session, query, tool_args=None):
         session: MCP 客户端会话
         query: 搜索查询
         tool_args: 额外的工具参数字典
+        call: 预先绑定的 session.call_tool，批量构造任务时避免重复查找属性
     返回值:
         CallResult: 调用结果
     """
+    if call is None:
+        call = session.call_tool
     args = {"query": query}
     if tool_args:
         args.update(tool_args)
 
-    start = time.monotonic()
-    try:
-        result = await asyncio.wait_for(
-            session.call_tool("google_search", arguments=args),
-            timeout=60,
-        )
-        elapsed = time.monotonic() - start
-
-        text = ""
-        for content in result.content:
-            if content.type == "text":
-                text += content.text
-
-        has_sources = "## Sources" in text
-        ERROR_PREFIXES = (
-            "Error performing search:",
-            "搜索失败:",
-            "参数错误:",
-        )
-        is_error = any(text.startswith(p) for p in ERROR_PREFIXES)
-
-        return CallResult(
-            query=query[:50],
-            success=not is_error,
-            duration=elapsed,
-            response_len=len(text),
-            has_sources=has_sources,
-            error=text[:200] if is_error else "",
-        )
-    except asyncio.TimeoutError:
-        elapsed = time.monotonic() - start
-        return CallResult(
-            query=query[:50],
-            success=False,
-            duration=elapsed,
-            error="超时 (60s)",
-        )
-    except Exception as e:
-        elapsed = time.monotonic() - start
-        return CallResult(
-            query=query[:50],
-            success=False,
-            duration=elapsed,
-            error=str(e)[:200],
-        )
+    short_query = query[:50]
+    failed = functools.partial(CallResult, query=short_query, success=False)
+
+    # 排队等待信号量的时间不计入单次耗时
+    async with _SEM:
+        start = time.perf_counter_ns()
+        try:
+            result = await asyncio.wait_for(
+                call("google_search", arguments=args),
+                timeout=60,
+            )
+            elapsed = time.perf_counter_ns() - start
+
+            text = "".join(c.text for c in result.content if c.type == "text")
+
+            has_sources = "## Sources" in text
+            is_error = _ERROR_RE.match(text) is not None
+
+            return CallResult(
+                query=short_query,
+                success=not is_error,
+                duration=elapsed,
+                response_len=len(text),
+                has_sources=has_sources,
+                error=text[:200] if is_error else "",
+            )
+        except asyncio.TimeoutError:
+            return failed(
+                duration=time.perf_counter_ns() - start, error="超时 (60s)"
+            )
+        except Exception as e:
+            # CancelledError 属于 BaseException，不会在这里被吞掉；
+            # 其余异常 (如 McpError) 记为失败，避免中断整轮压测
+            return failed(duration=time.perf_counter_ns() - start, error=str(e)[:200])
 
 
 async def test_sequential(session, report):
@@ -230,7 +280,7 @@ async def test_sequential(session, report):
     for q in QUERIES_UNIQUE[:3]:
         r = await call_tool(session, q)
         report.results.append(r)
-        status = "✓" if r.success else "✗"
+        status = _STATUS[r.success]
         print(
             f"  {status} [{format_duration(r.duration)}] "
             f'q="{r.query}" '
@@ -241,6 +291,23 @@ async def test_sequential(session, report):
             print(f"    错误: {r.error}")
 
 
+def round_robin_calls(sessions, queries):
+    """
+    将查询轮流分配到多个会话 (各自独立的 MCP 服务进程) 上
+
+    参数:
+        sessions: MCP 客户端会话列表
+        queries: 查询列表
+    返回值:
+        list: call_tool 协程列表
+    """
+    calls = [s.call_tool for s in sessions]
+    k = len(sessions)
+    return [
+        call_tool(sessions[i % k], q, call=calls[i % k]) for i, q in enumerate(queries)
+    ]
+
+
 async def test_concurrent(session, report):
     """
     并发调用测试：同时发送多个不同请求
@@ -251,12 +318,14 @@ async def test_concurrent(session, report):
     返回值:
         无
     """
-    print_separator("测试2: 并发调用 (5个不同查询)")
-    tasks = [call_tool(session, q) for q in QUERIES_UNIQUE]
+    # 缓存在各服务进程内独立，这里固定使用一个会话，测试3 才能命中这些查询的缓存
+    print_separator(f"测试2: 并发调用 ({len(QUERIES_UNIQUE)}个不同查询)")
+    call = session.call_tool
+    tasks = [call_tool(session, q, call=call) for q in QUERIES_UNIQUE]
     results = await asyncio.gather(*tasks)
+    report.results.extend(results)
     for r in results:
-        report.results.append(r)
-        status = "✓" if r.success else "✗"
+        status = _STATUS[r.success]
         print(
             f"  {status} [{format_duration(r.duration)}] "
             f'q="{r.query}" '
@@ -282,7 +351,7 @@ async def test_cache(session, report):
         r = await call_tool(session, QUERY_CACHED)
         report.results.append(r)
         cache_results.append(r)
-        status = "✓" if r.success else "✗"
+        status = _STATUS[r.success]
         print(
             f"  第{i + 1}次: {status} "
             f"[{format_duration(r.duration)}] "
@@ -310,22 +379,28 @@ async def test_concurrent_same_query(session, report):
     """
     print_separator("测试4: 并发同查询 (竞态检测)")
     fresh_query = "Node.js 最新 LTS 版本"
-    tasks = [call_tool(session, fresh_query) for _ in range(5)]
+    call = session.call_tool
+    tasks = [call_tool(session, fresh_query, call=call) for _ in range(5)]
     results = await asyncio.gather(*tasks)
+    report.results.extend(results)
 
-    responses = set()
+    # 记录第一个成功响应的长度，后续成功响应与之比较
+    first_len = None
+    diverged = False
     for i, r in enumerate(results):
-        report.results.append(r)
-        status = "✓" if r.success else "✗"
+        status = _STATUS[r.success]
         print(
             f"  副本{i + 1}: {status} "
             f"[{format_duration(r.duration)}] "
             f"len={r.response_len}"
         )
         if r.success:
-            responses.add(r.response_len)
+            if first_len is None:
+                first_len = r.response_len
+            elif r.response_len != first_len:
+                diverged = True
 
-    if len(responses) > 1:
+    if diverged:
         print("  ⚠ 警告: 同查询返回了不同长度的响应，可能存在竞态问题")
 
 
@@ -351,7 +426,7 @@ async def test_edge_cases(session, report):
     for label, q in zip(labels, QUERIES_EDGE):
         r = await call_tool(session, q)
         report.results.append(r)
-        status = "✓" if r.success else "✗"
+        status = _STATUS[r.success]
         print(
             f"  {status} [{label}] "
             f"dur={format_duration(r.duration)} "
@@ -372,24 +447,10 @@ async def test_invalid_params(session, report):
         无
     """
     print_separator("测试6: 无效参数")
-    invalid_cases = [
-        (
-            "不存在的模型",
-            {"model": "nonexistent-model-xyz"},
-        ),
-        (
-            "负数重试",
-            {"retry_count": -1},
-        ),
-        (
-            "超大重试延迟",
-            {"retry_delay": 99999},
-        ),
-    ]
-    for label, extra_args in invalid_cases:
+    for label, extra_args in INVALID_CASES:
         r = await call_tool(session, "test query", tool_args=extra_args)
         report.results.append(r)
-        status = "✓" if r.success else "✗"
+        status = _STATUS[r.success]
         print(
             f"  {status} [{label}] "
             f"dur={format_duration(r.duration)} "
@@ -397,38 +458,37 @@ async def test_invalid_params(session, report):
         )
 
 
-async def test_burst(session, report):
+async def test_burst(sessions, report):
     """
     突发流量测试：短时间内发送大量请求
 
     参数:
-        session: MCP 客户端会话
+        sessions: MCP 客户端会话列表，请求轮流分配
         report: 压测报告对象
     返回值:
         无
     """
-    print_separator("测试7: 突发流量 (10个并发请求)")
-    burst_queries = [f"技术问题 {i}" for i in range(10)]
-    tasks = [call_tool(session, q) for q in burst_queries]
-
-    start = time.monotonic()
-    results = await asyncio.gather(*tasks)
-    wall_time = time.monotonic() - start
-
-    ok = sum(1 for r in results if r.success)
-    fail = sum(1 for r in results if not r.success)
+    print_separator(
+        f"测试7: 突发流量 ({len(QUERIES_BURST)}个并发请求, {len(sessions)}个会话)"
+    )
+    tasks = round_robin_calls(sessions, QUERIES_BURST)
 
-    for r in results:
+    start = time.perf_counter_ns()
+    ok = fail = 0
+    # 按完成顺序处理结果，失败详情在请求结束时立即输出，不必等待最慢的请求
+    for fut in asyncio.as_completed(tasks):
+        r = await fut
         report.results.append(r)
+        if r.success:
+            ok += 1
+        else:
+            fail += 1
+            print(f'  ✗ q="{r.query}" err={r.error[:80]}')
+    wall_time = time.perf_counter_ns() - start
 
     print(f"  总耗时: {format_duration(wall_time)}")
     print(f"  成功: {ok}, 失败: {fail}")
-    print(f"  吞吐量: {len(results) / wall_time:.2f} req/s")
-
-    # 打印失败详情
-    for r in results:
-        if not r.success:
-            print(f'  ✗ q="{r.query}" err={r.error[:80]}')
+    print(f"  吞吐量: {len(tasks) / (wall_time / 1e9):.2f} req/s")
 
 
 # ============================================================
@@ -447,19 +507,23 @@ def print_report(report):
     """
     print_separator("压测汇总报告")
 
+    # successes/failures 属性每次访问都会重新扫描 results，这里只取一次
+    successes = report.successes
+    failures = report.failures
+
     total_time = report.end_time - report.start_time
     print(f"总耗时: {format_duration(total_time)}")
     print(
         f"总请求: {report.total} | "
-        f"成功: {len(report.successes)} | "
-        f"失败: {len(report.failures)}"
+        f"成功: {len(successes)} | "
+        f"失败: {len(failures)}"
     )
 
     if report.total > 0:
-        rate = len(report.successes) / report.total * 100
+        rate = len(successes) / report.total * 100
         print(f"成功率: {rate:.1f}%")
 
-    durations = report.durations
+    durations = [r.duration for r in successes]
     if durations:
         stats = compute_stats(durations)
         print(f"\n响应时间分布 (仅成功请求):")
@@ -473,9 +537,9 @@ def print_report(report):
             print(f"  标准差: {format_duration(stats['stdev'])}")
 
     # 打印所有失败详情
-    if report.failures:
-        print(f"\n失败详情 ({len(report.failures)} 个):")
-        for r in report.failures:
+    if failures:
+        print(f"\n失败详情 ({len(failures)} 个):")
+        for r in failures:
             print(
                 f'  ✗ q="{r.query}" '
                 f"dur={format_duration(r.duration)} "
@@ -483,7 +547,7 @@ def print_report(report):
             )
 
     # 无来源的成功请求
-    no_src = [r for r in report.successes if not r.has_sources]
+    no_src = [r for r in successes if not r.has_sources]
     if no_src:
         print(f"\n⚠ {len(no_src)} 个成功请求无来源引用:")
         for r in no_src:
@@ -519,36 +583,45 @@ async def run():
     report = StressReport()
 
     try:
-        async with stdio_client(server_params) as (read, write):
-            async with ClientSession(read, write) as session:
-                await session.initialize()
-
-                # 验证工具列表
-                tools = await session.list_tools()
-                tool_names = [t.name for t in tools.tools]
-                print(f"可用工具: {tool_names}")
-
-                if "google_search" not in tool_names:
-                    print("错误: google_search 工具未找到")
-                    return
-
-                report.start_time = time.monotonic()
-
-                # 依次执行测试
-                await test_sequential(session, report)
-                await test_concurrent(session, report)
-                await test_cache(session, report)
-                await test_concurrent_same_query(session, report)
-                await test_edge_cases(session, report)
-                await test_invalid_params(session, report)
-                await test_burst(session, report)
-
-                report.end_time = time.monotonic()
+        async with contextlib.AsyncExitStack() as stack:
+            # 每个会话对应一个独立的 MCP 服务进程
+            sessions = []
+            for _ in range(STRESS_SESSIONS):
+                read, write = await stack.enter_async_context(
+                    stdio_client(server_params)
+                )
+                sessions.append(
+                    await stack.enter_async_context(ClientSession(read, write))
+                )
+            await asyncio.gather(*(s.initialize() for s in sessions))
+            session = sessions[0]
+
+            # 验证工具列表
+            tools = await session.list_tools()
+            tool_names = [t.name for t in tools.tools]
+            print(f"可用工具: {tool_names}")
+
+            if "google_search" not in tool_names:
+                print("错误: google_search 工具未找到")
+                return
+
+            report.start_time = time.perf_counter_ns()
+
+            # 依次执行测试；缓存与竞态测试依赖同一进程内的缓存，只使用第一个会话
+            await test_sequential(session, report)
+            await test_concurrent(session, report)
+            await test_cache(session, report)
+            await test_concurrent_same_query(session, report)
+            await test_edge_cases(session, report)
+            await test_invalid_params(session, report)
+            await test_burst(sessions, report)
+
+            report.end_time = time.perf_counter_ns()
 
     except Exception as e:
         print(f"\n致命错误: {e}")
         traceback.print_exc()
-        report.end_time = time.monotonic()
+        report.end_time = time.perf_counter_ns()
 
     print_report(report)
 
@@ -2,7 +2,9 @@ import sys
 import os
 import unittest
 import time
-from unittest.mock import MagicMock, patch
+import orjson
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
 
 # Add src to path if running directly
 sys.path.append(
@@ -12,13 +14,38 @@ sys.path.append(
 from gemini_grounding.search import search, search_cache
 
 
-class TestSearchCache(unittest.TestCase):
-    def setUp(self):
-        # Clear cache before each test
-        search_cache.clear()
+class _FakeResponse:
+    """Minimal stand-in for requests.Response; only what _perform_search reads."""
+
+    status_code = 200
+
+    def __init__(self, data):
+        self.content = orjson.dumps(data)
+
+    def raise_for_status(self):
+        pass
 
-        # Mock response data
-        self.mock_response_data = {
+
+class _FakeSession:
+    """Counts post() calls and always returns the same response."""
+
+    def __init__(self, response, delay=0):
+        self._response = response
+        self._delay = delay
+        self.post_calls = 0
+
+    def post(self, *args, **kwargs):
+        self.post_calls += 1
+        if self._delay:
+            time.sleep(self._delay)
+        return self._response
+
+
+class TestSearchCache(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # Mock response data, shared read-only by every test
+        cls.mock_response_data = {
             "candidates": [
                 {
                     "content": {"parts": [{"text": "Search Result"}]},
@@ -29,49 +56,86 @@ class TestSearchCache(unittest.TestCase):
                 }
             ]
         }
+        cls.mock_response = _FakeResponse(cls.mock_response_data)
 
-    @patch("gemini_grounding.search.session")
-    def test_caching_behavior(self, mock_session):
-        # Setup mock response
-        mock_response = MagicMock()
-        mock_response.json.return_value = self.mock_response_data
-        mock_response.status_code = 200
-        mock_session.post.return_value = mock_response
+    def setUp(self):
+        # Clear cache before each test
+        search_cache.clear()
+
+    def _patch_session(self, delay=0):
+        fake_session = _FakeSession(self.mock_response, delay)
+        patcher = patch("gemini_grounding.search.session", fake_session)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return fake_session
+
+    def test_caching_behavior(self):
+        fake_session = self._patch_session()
 
         # First call (should hit API)
         result1 = search("test query", api_key="test_key")
         self.assertEqual(result1["text"], "Search Result")
-        self.assertEqual(mock_session.post.call_count, 1)
+        self.assertEqual(fake_session.post_calls, 1)
 
-        # Reset mock but keep return value
-        mock_session.post.reset_mock()
+        # Reset the counter
+        fake_session.post_calls = 0
 
         # Second call with same params (should hit cache)
         result2 = search("test query", api_key="test_key")
         self.assertEqual(result2["text"], "Search Result")
-        self.assertEqual(mock_session.post.call_count, 0)
+        self.assertEqual(fake_session.post_calls, 0)
 
         # Third call with different query (should hit API)
         result3 = search("different query", api_key="test_key")
-        self.assertEqual(mock_session.post.call_count, 1)
+        self.assertEqual(fake_session.post_calls, 1)
 
-    @patch("gemini_grounding.search.session")
-    def test_cache_key_excludes_retry(self, mock_session):
-        # Setup mock response
-        mock_response = MagicMock()
-        mock_response.json.return_value = self.mock_response_data
-        mock_response.status_code = 200
-        mock_session.post.return_value = mock_response
+    def test_cache_key_excludes_retry(self):
+        fake_session = self._patch_session()
 
         # First call
         search("test query", api_key="test_key", retry_count=3)
-        self.assertEqual(mock_session.post.call_count, 1)
+        self.assertEqual(fake_session.post_calls, 1)
 
-        mock_session.post.reset_mock()
+        fake_session.post_calls = 0
 
         # Second call with different retry_count (should still hit cache)
         search("test query", api_key="test_key", retry_count=5)
-        self.assertEqual(mock_session.post.call_count, 0)
+        self.assertEqual(fake_session.post_calls, 0)
+
+    def test_cache_key_normalizes_query(self):
+        fake_session = self._patch_session()
+
+        search("python latest", api_key="test_key")
+        self.assertEqual(fake_session.post_calls, 1)
+
+        fake_session.post_calls = 0
+
+        # Extra whitespace and different case should hit the same entry
+        search("  Python   LATEST\n", api_key="test_key")
+        self.assertEqual(fake_session.post_calls, 0)
+
+    @patch.dict(os.environ, {"GEMINI_CACHE_ENABLED": "0"})
+    def test_cache_disabled(self):
+        fake_session = self._patch_session()
+
+        search("test query", api_key="test_key")
+        search("test query", api_key="test_key")
+        self.assertEqual(fake_session.post_calls, 2)
+        self.assertEqual(len(search_cache), 0)
+
+    def test_concurrent_misses_share_one_request(self):
+        fake_session = self._patch_session(delay=0.2)
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            results = list(
+                executor.map(
+                    lambda _: search("in flight query", api_key="test_key"),
+                    range(4),
+                )
+            )
+
+        self.assertEqual(fake_session.post_calls, 1)
+        self.assertTrue(all(r["text"] == "Search Result" for r in results))
 
 
 if __name__ == "__main__":
@@ -1,3 +1,4 @@
+import asyncio
 import sys
 import os
 import unittest
@@ -29,18 +30,20 @@ from mcp_server import google_search
 
 
 class TestMCP(unittest.TestCase):
+    # Mock search() return values, shared read-only by the tests
+    SEARCH_RESULT = {
+        "text": "This is a test result [1].",
+        "sources": [{"id": 1, "title": "Test Source", "url": "https://example.com"}],
+    }
+    EMPTY_RESULT = {"text": "Result", "sources": []}
+
     @patch("mcp_server.search")
     def test_google_search(self, mock_search):
         # Setup mock return value
-        mock_search.return_value = {
-            "text": "This is a test result [1].",
-            "sources": [
-                {"id": 1, "title": "Test Source", "url": "https://example.com"}
-            ],
-        }
+        mock_search.return_value = self.SEARCH_RESULT
 
         # Call the tool
-        result = google_search("test query")
+        result = asyncio.run(google_search("test query"))
         print(f"DEBUG: result = {result}")
 
         import mcp_server
@@ -64,10 +67,12 @@ class TestMCP(unittest.TestCase):
 
     @patch("mcp_server.search")
     def test_google_search_custom_params(self, mock_search):
-        mock_search.return_value = {"text": "Result", "sources": []}
+        mock_search.return_value = self.EMPTY_RESULT
 
-        google_search(
-            "query", retry_count=5, search_delay_min=1.0, search_delay_max=2.0
+        asyncio.run(
+            google_search(
+                "query", retry_count=5, search_delay_min=1.0, search_delay_max=2.0
+            )
         )
 
         mock_search.assert_called_with(
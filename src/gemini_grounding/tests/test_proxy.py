@@ -5,12 +5,24 @@ import sys
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from search import resolve_url
+import httpx
+import orjson
+import requests
+
+import search
+from search import (
+    resolve_url,
+    resolve_urls_concurrently,
+    url_cache,
+    url_negative_cache,
+)
 
 
 class TestProxy(unittest.TestCase):
     def setUp(self):
-        resolve_url.cache_clear()
+        url_cache.clear()
+        url_negative_cache.clear()
+        search._batch_unsupported_proxies.clear()
 
     @patch("search.session")
     @patch.dict(os.environ, {"GEMINI_PROXY_URL": "https://my-proxy.com"}, clear=True)
@@ -30,20 +42,224 @@ class TestProxy(unittest.TestCase):
         )
         self.assertEqual(result, "https://final-destination.com")
 
+    @patch("search.session")
+    @patch.dict(os.environ, {"GEMINI_PROXY_URL": "https://my-proxy.com"}, clear=True)
+    def test_proxy_identity_final_url_is_a_miss(self, mock_session):
+        url = "https://vertexaisearch.cloud.google.com/grounding-api-redirect/gone"
+        # What worker.js sends in manual mode for a 404 from the target
+        mock_response = MagicMock()
+        mock_response.status_code = 404
+        mock_response.headers = {"X-Final-Url": url}
+        mock_session.head.return_value = mock_response
+
+        self.assertEqual(resolve_url(url), url)
+        self.assertIn(url, url_negative_cache)
+        self.assertNotIn(url, url_cache)
+
     @patch("search.session")
     @patch.dict(os.environ, {}, clear=True)
     def test_proxy_not_configured(self, mock_session):
         mock_response = MagicMock()
         mock_response.status_code = 200
-        mock_response.url = "https://direct-resolved.com"
+        mock_response.headers = {
+            "Link": '<https://direct-resolved.com>; rel="canonical"'
+        }
         mock_session.head.return_value = mock_response
 
         url = "https://vertexaisearch.cloud.google.com/grounding-api-redirect/bar"
         result = resolve_url(url)
 
-        mock_session.head.assert_called_with(url, allow_redirects=True, timeout=5)
+        mock_session.head.assert_called_with(url, allow_redirects=False, timeout=5)
         self.assertEqual(result, "https://direct-resolved.com")
 
+    @patch("search.session")
+    @patch.dict(os.environ, {}, clear=True)
+    def test_proxy_not_configured_redirect(self, mock_session):
+        mock_response = MagicMock()
+        mock_response.status_code = 302
+        mock_response.headers = {"Location": "https://redirect-target.com/page"}
+        mock_session.head.return_value = mock_response
+
+        url = "https://vertexaisearch.cloud.google.com/grounding-api-redirect/qux"
+        result = resolve_url(url)
+
+        mock_session.head.assert_called_once_with(
+            url, allow_redirects=False, timeout=5
+        )
+        self.assertEqual(result, "https://redirect-target.com/page")
+
+    @patch("search.session")
+    @patch.dict(os.environ, {}, clear=True)
+    def test_resolved_url_is_cached(self, mock_session):
+        mock_response = MagicMock()
+        mock_response.status_code = 302
+        mock_response.headers = {"Location": "https://direct-resolved.com"}
+        mock_session.head.return_value = mock_response
+
+        url = "https://vertexaisearch.cloud.google.com/grounding-api-redirect/baz"
+        self.assertEqual(resolve_url(url), "https://direct-resolved.com")
+        self.assertEqual(resolve_url(url), "https://direct-resolved.com")
+        self.assertEqual(mock_session.head.call_count, 1)
+
+    @patch("search.session")
+    @patch.dict(os.environ, {"GEMINI_PROXY_URL": "https://my-proxy.com"}, clear=True)
+    def test_unresolvable_url_is_negatively_cached(self, mock_session):
+        mock_response = MagicMock()
+        mock_response.status_code = 404
+        mock_response.headers = {}
+        mock_session.head.return_value = mock_response
+
+        url = "https://vertexaisearch.cloud.google.com/grounding-api-redirect/nope"
+        self.assertEqual(resolve_url(url), url)
+        self.assertEqual(resolve_url(url), url)
+        self.assertEqual(mock_session.head.call_count, 1)
+        self.assertIn(url, url_negative_cache)
+        self.assertNotIn(url, url_cache)
+
+    @patch("search.session")
+    @patch.dict(os.environ, {}, clear=True)
+    def test_direct_200_without_canonical_is_a_miss(self, mock_session):
+        url = "https://vertexaisearch.cloud.google.com/grounding-api-redirect/ok"
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.url = url
+        mock_response.headers = {}
+        mock_session.head.return_value = mock_response
+
+        self.assertEqual(resolve_url(url), url)
+        self.assertIn(url, url_negative_cache)
+        self.assertNotIn(url, url_cache)
+
+    @patch("search.session")
+    def test_non_grounding_url_skips_network(self, mock_session):
+        url = "https://example.com/page"
+        self.assertEqual(resolve_url(url), url)
+        mock_session.head.assert_not_called()
+        self.assertNotIn(url, url_cache)
+
+    @patch("search.session")
+    @patch.dict(os.environ, {"GEMINI_PROXY_URL": "https://my-proxy.com"}, clear=True)
+    def test_proxy_batch_resolves_in_one_request(self, mock_session):
+        url_a = "https://vertexaisearch.cloud.google.com/grounding-api-redirect/a"
+        url_b = "https://vertexaisearch.cloud.google.com/grounding-api-redirect/b"
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        # worker.js maps a URL it could not resolve to itself
+        mock_response.content = orjson.dumps(
+            {url_a: "https://a.example.com", url_b: url_b}
+        )
+        mock_session.post.return_value = mock_response
+
+        result = resolve_urls_concurrently([url_a, url_b, url_a])
+
+        mock_session.post.assert_called_once()
+        args, kwargs = mock_session.post.call_args
+        self.assertEqual(args[0], "https://my-proxy.com/batch")
+        self.assertEqual(orjson.loads(kwargs["data"]), {"urls": [url_a, url_b]})
+        mock_session.head.assert_not_called()
+        self.assertEqual(result, {url_a: "https://a.example.com", url_b: url_b})
+        self.assertEqual(url_cache[url_a], "https://a.example.com")
+        self.assertIn(url_b, url_negative_cache)
+
+    @patch("search.session")
+    @patch.dict(os.environ, {"GEMINI_PROXY_URL": "https://my-proxy.com"}, clear=True)
+    def test_proxy_without_batch_falls_back_to_head(self, mock_session):
+        url = "https://vertexaisearch.cloud.google.com/grounding-api-redirect/foo"
+        mock_session.post.return_value = MagicMock(status_code=400)
+        mock_head = MagicMock()
+        mock_head.headers = {"X-Final-Url": "https://final-destination.com"}
+        mock_session.head.return_value = mock_head
+
+        result = resolve_urls_concurrently([url])
+
+        self.assertEqual(result, {url: "https://final-destination.com"})
+        self.assertIn("https://my-proxy.com", search._batch_unsupported_proxies)
+        mock_session.head.assert_called_once()
+
+    @patch("search.session")
+    @patch.dict(os.environ, {"GEMINI_PROXY_URL": "https://my-proxy.com"}, clear=True)
+    def test_proxy_batch_is_chunked(self, mock_session):
+        prefix = "https://vertexaisearch.cloud.google.com/grounding-api-redirect/"
+        urls = [f"{prefix}{i}" for i in range(search.PROXY_BATCH_SIZE + 1)]
+
+        def fake_post(url, data=None, **kwargs):
+            batch = orjson.loads(data)["urls"]
+            self.assertLessEqual(len(batch), search.PROXY_BATCH_SIZE)
+            response = MagicMock(status_code=200)
+            response.content = orjson.dumps({u: u + "/final" for u in batch})
+            return response
+
+        mock_session.post.side_effect = fake_post
+
+        result = resolve_urls_concurrently(urls)
+
+        self.assertEqual(mock_session.post.call_count, 2)
+        self.assertEqual(result, {u: u + "/final" for u in urls})
+        mock_session.head.assert_not_called()
+
+    @patch("search.session")
+    @patch.dict(os.environ, {"GEMINI_PROXY_URL": "https://my-proxy.com"}, clear=True)
+    def test_proxy_batch_failure_falls_back_to_head(self, mock_session):
+        url = "https://vertexaisearch.cloud.google.com/grounding-api-redirect/foo"
+        mock_session.post.side_effect = requests.ConnectionError("reset")
+        mock_head = MagicMock()
+        mock_head.headers = {"X-Final-Url": "https://final-destination.com"}
+        mock_session.head.return_value = mock_head
+
+        result = resolve_urls_concurrently([url])
+
+        self.assertEqual(result, {url: "https://final-destination.com"})
+        self.assertNotIn(url, url_negative_cache)
+        # A transport error is not a sign of an old worker
+        self.assertNotIn("https://my-proxy.com", search._batch_unsupported_proxies)
+
+    @patch("search.resolve_url")
+    @patch.dict(os.environ, {}, clear=True)
+    def test_failed_uri_does_not_abort_batch(self, mock_resolve):
+        url_a = "https://vertexaisearch.cloud.google.com/grounding-api-redirect/a"
+        url_b = "https://vertexaisearch.cloud.google.com/grounding-api-redirect/b"
+
+        def fake_resolve(url, proxy_base=None):
+            if url == url_a:
+                raise RuntimeError("boom")
+            return "https://b.example.com"
+
+        mock_resolve.side_effect = fake_resolve
+
+        result = resolve_urls_concurrently([url_a, url_b])
+
+        self.assertEqual(result, {url_a: url_a, url_b: "https://b.example.com"})
+
+    @patch("search.session")
+    @patch("search._get_http2_client")
+    @patch.dict(os.environ, {}, clear=True)
+    def test_http2_client_response_is_used(self, mock_get_client, mock_session):
+        client = MagicMock()
+        client.head.return_value = httpx.Response(302, headers={"Location": "/page"})
+        mock_get_client.return_value = client
+
+        url = "https://vertexaisearch.cloud.google.com/grounding-api-redirect/h2"
+        result = resolve_url(url)
+
+        client.head.assert_called_once_with(url, timeout=5)
+        mock_session.head.assert_not_called()
+        self.assertEqual(result, "https://vertexaisearch.cloud.google.com/page")
+
+    @patch("search._get_http2_client")
+    @patch.dict(os.environ, {}, clear=True)
+    def test_http2_client_error_is_requests_error(self, mock_get_client):
+        client = MagicMock()
+        client.head.side_effect = httpx.ConnectError("refused")
+        mock_get_client.return_value = client
+
+        url = "https://vertexaisearch.cloud.google.com/grounding-api-redirect/h2"
+        with self.assertRaises(requests.ConnectionError):
+            search._head(url)
+
+        # resolve_url treats it like any other transport failure
+        self.assertEqual(resolve_url(url), url)
+        self.assertIn(url, url_negative_cache)
+
 
 if __name__ == "__main__":
     unittest.main()
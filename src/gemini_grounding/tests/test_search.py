@@ -4,9 +4,10 @@ import sys
 import io
 import os
 import time
+import orjson
 import requests
 
-sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import search
 
 
@@ -22,16 +23,20 @@ class TestSearchComprehensive(unittest.TestCase):
         self.env_patcher = patch.dict(os.environ, {"GEMINI_API_KEY": "test_api_key"})
         self.env_patcher.start()
 
+        # Every test searches "test query"; start each one with a cold cache
+        search.search_cache.clear()
+
     def tearDown(self):
         sys.stdout = self.stdout_original
         sys.stderr = self.stderr_original
         self.env_patcher.stop()
 
-    @patch("requests.post")
-    def test_default_model(self, mock_post):
+    @patch("search.session")
+    def test_default_model(self, mock_session):
+        mock_post = mock_session.post
         mock_response = MagicMock()
         mock_response.status_code = 200
-        mock_response.json.return_value = {"candidates": []}
+        mock_response.content = b'{"candidates": []}'
         mock_post.return_value = mock_response
 
         with patch("sys.argv", ["search.py", "--query", "test query"]):
@@ -43,11 +48,12 @@ class TestSearchComprehensive(unittest.TestCase):
             args, _ = mock_post.call_args
             self.assertIn("gemini-2.5-flash", args[0])
 
-    @patch("requests.post")
-    def test_model_argument_override(self, mock_post):
+    @patch("search.session")
+    def test_model_argument_override(self, mock_session):
+        mock_post = mock_session.post
         mock_response = MagicMock()
         mock_response.status_code = 200
-        mock_response.json.return_value = {"candidates": []}
+        mock_response.content = b'{"candidates": []}'
         mock_post.return_value = mock_response
 
         with patch(
@@ -62,11 +68,12 @@ class TestSearchComprehensive(unittest.TestCase):
             args, _ = mock_post.call_args
             self.assertIn("custom-model", args[0])
 
-    @patch("requests.post")
-    def test_env_var_model(self, mock_post):
+    @patch("search.session")
+    def test_env_var_model(self, mock_session):
+        mock_post = mock_session.post
         mock_response = MagicMock()
         mock_response.status_code = 200
-        mock_response.json.return_value = {"candidates": []}
+        mock_response.content = b'{"candidates": []}'
         mock_post.return_value = mock_response
 
         with patch.dict(os.environ, {"GEMINI_MODEL": "env-model"}):
@@ -79,8 +86,9 @@ class TestSearchComprehensive(unittest.TestCase):
                 args, _ = mock_post.call_args
                 self.assertIn("env-model", args[0])
 
-    @patch("requests.post")
-    def test_retry_mechanism_success_after_failure(self, mock_post):
+    @patch("search.session")
+    def test_retry_mechanism_success_after_failure(self, mock_session):
+        mock_post = mock_session.post
         fail_response = MagicMock()
         fail_response.status_code = 500
         fail_exception = requests.exceptions.RequestException(
@@ -89,27 +97,30 @@ class TestSearchComprehensive(unittest.TestCase):
 
         success_response = MagicMock()
         success_response.status_code = 200
-        success_response.json.return_value = {"candidates": []}
+        success_response.content = b'{"candidates": []}'
 
         mock_post.side_effect = [fail_exception, fail_exception, success_response]
 
         with patch.dict(
             os.environ, {"GEMINI_RETRY_DELAY": "0.1", "GEMINI_RETRY_COUNT": "3"}
         ):
-            with patch("sys.argv", ["search.py", "--query", "test query"]):
-                try:
-                    search.main()
-                except SystemExit:
-                    pass
+            # Retry warnings are only logged with --debug
+            with patch("sys.argv", ["search.py", "--query", "test query", "--debug"]):
+                with self.assertLogs(search.logger, level="WARNING") as logs:
+                    try:
+                        search.main()
+                    except SystemExit:
+                        pass
 
                 self.assertEqual(mock_post.call_count, 3)
 
-                output = self.held_stderr.getvalue()
+                output = "\n".join(logs.output)
                 self.assertIn("Request failed (attempt 1/4)", output)
                 self.assertIn("Request failed (attempt 2/4)", output)
 
-    @patch("requests.post")
-    def test_retry_exhaustion(self, mock_post):
+    @patch("search.session")
+    def test_retry_exhaustion(self, mock_session):
+        mock_post = mock_session.post
         fail_response = MagicMock()
         fail_response.status_code = 503
         fail_exception = requests.exceptions.RequestException(
@@ -130,11 +141,12 @@ class TestSearchComprehensive(unittest.TestCase):
 
     @patch("time.sleep")
     @patch("random.uniform")
-    @patch("requests.post")
-    def test_random_delay(self, mock_post, mock_uniform, mock_sleep):
+    @patch("search.session")
+    def test_random_delay(self, mock_session, mock_uniform, mock_sleep):
+        mock_post = mock_session.post
         mock_response = MagicMock()
         mock_response.status_code = 200
-        mock_response.json.return_value = {"candidates": []}
+        mock_response.content = b'{"candidates": []}'
         mock_post.return_value = mock_response
 
         mock_uniform.return_value = 1.5
@@ -152,11 +164,12 @@ class TestSearchComprehensive(unittest.TestCase):
                 mock_uniform.assert_called_with(1.0, 2.0)
                 mock_sleep.assert_any_call(1.5)
 
-    @patch("requests.post")
-    def test_default_tool_config(self, mock_post):
+    @patch("search.session")
+    def test_default_tool_config(self, mock_session):
+        mock_post = mock_session.post
         mock_response = MagicMock()
         mock_response.status_code = 200
-        mock_response.json.return_value = {"candidates": []}
+        mock_response.content = b'{"candidates": []}'
         mock_post.return_value = mock_response
 
         with patch("sys.argv", ["search.py", "--query", "test query"]):
@@ -166,11 +179,59 @@ class TestSearchComprehensive(unittest.TestCase):
                 pass
 
             args, kwargs = mock_post.call_args
-            payload = kwargs["json"]
+            payload = orjson.loads(kwargs["data"])
             tools = payload.get("tools", [])
 
             self.assertTrue(any("googleSearch" in tool for tool in tools))
 
+    @patch("search.session")
+    def test_citations_use_utf8_byte_offsets(self, mock_session):
+        # "中文句子。" is 5 characters but 15 UTF-8 bytes; Gemini's endIndex
+        # counts bytes, so both citations belong right after it
+        data = {
+            "candidates": [
+                {
+                    "content": {
+                        "parts": [{"text": "中文句子。"}, {"text": "ASCII part."}]
+                    },
+                    "groundingMetadata": {
+                        "groundingChunks": [
+                            {"web": {"uri": "https://example.com/a", "title": "A"}},
+                            {"web": {"uri": "https://example.com/b", "title": "B"}},
+                            {"web": {"uri": "https://example.com/a", "title": "A"}},
+                        ],
+                        "groundingSupports": [
+                            {
+                                "segment": {"endIndex": 15},
+                                "groundingChunkIndices": [2, 1, 0, 1],
+                            },
+                            {
+                                "segment": {"endIndex": 15},
+                                "groundingChunkIndices": [0],
+                            },
+                        ],
+                    },
+                }
+            ]
+        }
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.content = orjson.dumps(data)
+        mock_session.post.return_value = mock_response
+
+        result = search.search("citation query", retry_count=0)
+
+        # Ids are deduped and sorted within a support; supports sharing an
+        # endIndex keep their response order
+        self.assertEqual(result["text"], "中文句子。 [1, 2] [1]ASCII part.")
+        self.assertEqual(
+            result["sources"],
+            [
+                {"id": 1, "title": "A", "url": "https://example.com/a"},
+                {"id": 2, "title": "B", "url": "https://example.com/b"},
+            ],
+        )
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -1,3 +1,77 @@
+const GOOGLEBOT_UA = "Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)";
+const MAX_BATCH_URLS = 50;
+
+const CANONICAL_LINK_RE = /<([^>]+)>;\s*rel="canonical"/;
+
+// Where a manual-redirect response points to, in the order the Python client
+// checks: redirect Location, then canonical Link on 200, else the URL itself.
+// Shared by the single-URL manual mode (X-Final-Url) and the /batch endpoint
+// so both report the same destination. Returning the URL itself means no
+// destination was found; the client caches it as unresolved.
+function finalUrlFor(response, targetUrl) {
+  if (response.status >= 300 && response.status < 400) {
+    const location = response.headers.get("Location");
+    if (location) {
+      return new URL(location, targetUrl).toString();
+    }
+  } else if (response.status === 200) {
+    const match = CANONICAL_LINK_RE.exec(response.headers.get("Link") || "");
+    if (match) {
+      return match[1];
+    }
+  }
+  return targetUrl;
+}
+
+async function resolveBatch(request) {
+  const corsHeaders = {
+    "Access-Control-Allow-Origin": "*",
+    "Content-Type": "application/json",
+  };
+
+  let urls;
+  try {
+    ({ urls } = await request.json());
+  } catch (e) {
+    urls = null;
+  }
+  if (!Array.isArray(urls)) {
+    return new Response(JSON.stringify({ error: "Expected a JSON body of {urls: [...]}" }), {
+      status: 400,
+      headers: corsHeaders
+    });
+  }
+
+  // Duplicate URLs are only fetched once
+  const unique = [...new Set(urls)].filter(
+    (u) => typeof u === "string" && u.startsWith("http")
+  );
+  // Refuse oversize batches instead of silently dropping the tail; clients
+  // send at most MAX_BATCH_URLS per request.
+  if (unique.length > MAX_BATCH_URLS) {
+    return new Response(JSON.stringify({ error: `At most ${MAX_BATCH_URLS} URLs per batch` }), {
+      status: 413,
+      headers: corsHeaders
+    });
+  }
+
+  const resolved = {};
+  await Promise.all(unique.map(async (targetUrl) => {
+    try {
+      const response = await fetch(targetUrl, {
+        method: "HEAD",
+        headers: { "User-Agent": GOOGLEBOT_UA },
+        redirect: "manual"
+      });
+      resolved[targetUrl] = finalUrlFor(response, targetUrl);
+    } catch (e) {
+      // Unresolved URLs are left out of the map
+    }
+  }));
+
+  return new Response(JSON.stringify(resolved), { headers: corsHeaders });
+}
+
 export default {
   async fetch(request, env, ctx) {
     if (request.method === "OPTIONS") {
@@ -12,6 +86,11 @@ export default {
 
     try {
       const url = new URL(request.url);
+
+      if (request.method === "POST" && url.pathname === "/batch") {
+        return await resolveBatch(request);
+      }
+
       let targetUrl = url.pathname.slice(1) + url.search;
 
       if (!targetUrl.startsWith("http")) {
@@ -36,7 +115,7 @@ export default {
       const fetchOptions = {
         method: request.method,
         headers: {
-          "User-Agent": "Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)"
+          "User-Agent": GOOGLEBOT_UA
         },
         redirect: isManualMode ? "manual" : "follow"
       };
@@ -48,14 +127,7 @@ export default {
       headers.set("Access-Control-Expose-Headers", "X-Final-Url, Location");
 
       if (isManualMode) {
-        if (response.status >= 300 && response.status < 400) {
-            const location = response.headers.get("Location");
-            if (location) {
-                headers.set("X-Final-Url", location);
-            }
-        } else {
-            headers.set("X-Final-Url", targetUrl);
-        }
+        headers.set("X-Final-Url", finalUrlFor(response, targetUrl));
         
         return new Response(response.body, {
             status: response.status,